@@ -1,14 +1,56 @@
 import time
 import json
 import logging
+import logging.handlers
+import queue
 import datetime
-import pandas as pd
+from dataclasses import dataclass
+import math
+import hmac
+import hashlib
+import uuid
 import numpy as np
-import traceback
+import orjson
+import bottleneck as bn
+import threading
+from collections import deque
+from urllib.parse import urlencode
+import websocket
 from binance.client import Client
+from binance import ThreadedWebsocketManager
 from binance.exceptions import BinanceAPIException, BinanceRequestException
 from binance.enums import *
 
+# Endpoint del WS-API de Binance para enviar órdenes por websocket
+WS_API_URL = 'wss://ws-api.binance.com:443/ws-api/v3'
+WS_API_TIMEOUT = 10
+WS_API_PING_TIMEOUT = 2
+RECV_WINDOW = 5000
+
+# Antigüedad máxima (segundos) del precio del websocket antes de pedirlo por REST
+PRICE_STALE_SECONDS = 5
+
+# Conversión del timeframe de la configuración a formato Binance
+_TIMEFRAME_MAP = {
+    '1m': Client.KLINE_INTERVAL_1MINUTE,
+    '5m': Client.KLINE_INTERVAL_5MINUTE,
+    '15m': Client.KLINE_INTERVAL_15MINUTE,
+    '1h': Client.KLINE_INTERVAL_1HOUR,
+    '4h': Client.KLINE_INTERVAL_4HOUR,
+    '1d': Client.KLINE_INTERVAL_1DAY
+}
+
+# Numba es opcional: sin él los kernels se ejecutan como Python normal
+# y las Bandas de Bollinger se calculan con bottleneck
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
 # Configuración del sistema de logging
 def setup_logger():
     logger = logging.getLogger('crypto_trade_bot')
@@ -18,8 +60,8 @@ def setup_logger():
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     
-    # Handler para archivo
-    file_handler = logging.FileHandler('crypto_bot.log')
+    # Handler para archivo (rotativo)
+    file_handler = logging.handlers.RotatingFileHandler('crypto_bot.log', maxBytes=10_000_000, backupCount=3)
     file_handler.setLevel(logging.INFO)
     
     # Formato del log
@@ -27,132 +69,646 @@ def setup_logger():
     console_handler.setFormatter(formatter)
     file_handler.setFormatter(formatter)
     
-    # Agregar handlers al logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Escribir los logs desde un hilo aparte: el logger solo encola los mensajes
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.queue_listener = listener
     
     return logger
 
+# Detener el hilo de logging tras escribir los mensajes pendientes
+def shutdown_logger(logger):
+    listener = getattr(logger, 'queue_listener', None)
+    if listener is not None:
+        logger.queue_listener = None
+        listener.stop()
+
 # Cargar configuración desde el archivo config.json
 def load_config():
     try:
-        with open('config.json', 'r') as config_file:
-            return json.load(config_file)
+        with open('config.json', 'rb') as config_file:
+            return orjson.loads(config_file.read())
     except FileNotFoundError:
         logger.error("Archivo config.json no encontrado")
         raise
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         logger.error("Error al decodificar el archivo config.json")
         raise
 
+# Convertir un timeframe de Binance ('15m', '1h', '1d'...) a segundos
+def timeframe_to_seconds(timeframe):
+    units = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    return int(timeframe[:-1]) * units[timeframe[-1]]
+
+# Kernel de suavizado de Wilder sobre ganancias y pérdidas (el índice 0 no tiene variación):
+# la media se inicia con la media simple de las primeras `period` variaciones y después se
+# suaviza; escribe el resultado en avg_gain y avg_loss
+@njit(cache=True)
+def _wilder_nb(gain, loss, period, avg_gain, avg_loss):
+    n = gain.shape[0]
+    avg_gain[:] = np.nan
+    avg_loss[:] = np.nan
+    if n <= period:
+        return
+    
+    g = 0.0
+    l = 0.0
+    for i in range(1, period + 1):
+        g += gain[i]
+        l += loss[i]
+    g /= period
+    l /= period
+    avg_gain[period] = g
+    avg_loss[period] = l
+    
+    for i in range(period + 1, n):
+        g = (g * (period - 1) + gain[i]) / period
+        l = (l * (period - 1) + loss[i]) / period
+        avg_gain[i] = g
+        avg_loss[i] = l
+
+# Kernel Bandas de Bollinger: media y desviación estándar muestral con sumas móviles;
+# escribe el resultado en sma, upper y lower
+@njit(cache=True)
+def _bbands_nb(close, period, k, sma, upper, lower):
+    n = close.shape[0]
+    window_sum = 0.0
+    window_sumsq = 0.0
+    for i in range(n):
+        window_sum += close[i]
+        window_sumsq += close[i] * close[i]
+        if i >= period:
+            old = close[i - period]
+            window_sum -= old
+            window_sumsq -= old * old
+        if i >= period - 1:
+            mean = window_sum / period
+            std = np.sqrt(max((window_sumsq - window_sum * mean) / (period - 1), 0.0))
+            sma[i] = mean
+            upper[i] = mean + std * k
+            lower[i] = mean - std * k
+        else:
+            sma[i] = np.nan
+            upper[i] = np.nan
+            lower[i] = np.nan
+
+# Medias de Wilder de ganancias y pérdidas de una serie de cierres;
+# bufs=(gain, loss, avg_gain, avg_loss) permite reutilizar arrays de trabajo
+def _wilder_averages(close, period, bufs=None):
+    n = close.shape[0]
+    if bufs is None:
+        bufs = (np.empty(n), np.empty(n), np.empty(n), np.empty(n))
+    gain, loss, avg_gain, avg_loss = bufs
+    
+    gain[0] = np.nan
+    np.subtract(close[1:], close[:-1], out=gain[1:])
+    np.negative(gain, out=loss)
+    np.maximum(gain, 0.0, out=gain)
+    np.maximum(loss, 0.0, out=loss)
+    
+    _wilder_nb(gain, loss, period, avg_gain, avg_loss)
+    return avg_gain, avg_loss
+
+# RSI a partir de las medias de Wilder; escribe el resultado en out
+def _rsi_from_averages(avg_gain, avg_loss, out):
+    # Solo ganancias en la ventana: RSI 100; ventana plana (0/0): RSI indefinido (NaN)
+    out.fill(np.nan)
+    np.divide(avg_gain, avg_loss, out=out, where=avg_loss != 0)
+    np.copyto(out, np.inf, where=(avg_loss == 0) & (avg_gain > 0))
+    np.add(out, 1.0, out=out)
+    np.divide(100.0, out, out=out)
+    np.subtract(100.0, out, out=out)
+    return out
+
+# Bandas de Bollinger de una serie de cierres; escribe el resultado en sma, upper y lower
+def _bollinger_bands(close, period, std_dev, sma, upper, lower):
+    if NUMBA_AVAILABLE:
+        _bbands_nb(close, period, float(std_dev), sma, upper, lower)
+    else:
+        sma[:] = bn.move_mean(close, window=period, min_count=period)
+        std = bn.move_std(close, window=period, min_count=period, ddof=1)
+        np.multiply(std, std_dev, out=std)
+        np.add(sma, std, out=upper)
+        np.subtract(sma, std, out=lower)
+
+# Señales de compra y venta; acepta escalares (modo en vivo) o series completas (backtest)
+def _signals(close, rsi, upper, lower, oversold, overbought):
+    # Compra: RSI por debajo del nivel de sobreventa y precio cerca o por debajo de la banda inferior
+    buy = (rsi < oversold) & (close <= lower * 1.02)
+    # Venta: RSI por encima del nivel de sobrecompra o precio cerca o por encima de la banda superior
+    sell = (rsi > overbought) | (close >= upper * 0.98)
+    return buy, sell
+
+# Backtest vectorizado de las señales sobre una serie histórica de cierres (sin stop loss);
+# no necesita conexión con Binance y no modifica la serie recibida
+def backtest(close, rsi_period, bollinger_period, bollinger_std, oversold, overbought):
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    avg_gain, avg_loss = _wilder_averages(close, rsi_period)
+    rsi = _rsi_from_averages(avg_gain, avg_loss, np.empty_like(close))
+    sma, upper, lower = np.empty_like(close), np.empty_like(close), np.empty_like(close)
+    _bollinger_bands(close, bollinger_period, bollinger_std, sma, upper, lower)
+    buy, sell = _signals(close, rsi, upper, lower, oversold, overbought)
+    
+    # Recorrer solo las velas con señal: cada compra se cierra con la primera venta posterior
+    buy_idx = np.nonzero(buy)[0]
+    sell_idx = np.nonzero(sell)[0]
+    trades = []
+    start = 0
+    while True:
+        b = np.searchsorted(buy_idx, start)
+        if b == len(buy_idx):
+            break
+        entry = buy_idx[b]
+        s = np.searchsorted(sell_idx, entry, side='right')
+        if s == len(sell_idx):
+            break
+        exit_ = sell_idx[s]
+        trades.append({
+            'entry_index': int(entry),
+            'exit_index': int(exit_),
+            'buy_price': float(close[entry]),
+            'sell_price': float(close[exit_]),
+            'profit_percent': float((close[exit_] - close[entry]) / close[entry] * 100)
+        })
+        start = exit_ + 1
+    
+    return trades
+
+# Error al enviar una petición al WS-API: la orden no llegó a Binance y puede reenviarse por REST
+class WsApiConnectionError(Exception):
+    pass
+
+# Petición enviada al WS-API sin respuesta: su resultado es desconocido y no debe reenviarse
+class WsApiUnknownStateError(Exception):
+    pass
+
+# Cliente mínimo del WS-API de Binance sobre una única conexión persistente
+class BinanceWsApi:
+    def __init__(self, api_key, api_secret, url=WS_API_URL):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.url = url
+        self._ws = None
+
+    def connect(self):
+        self._ws = websocket.create_connection(self.url, timeout=WS_API_TIMEOUT)
+
+    @property
+    def connected(self):
+        return self._ws is not None and self._ws.connected
+
+    def close(self):
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            finally:
+                self._ws = None
+
+    # Firma HMAC-SHA256 de los parámetros ordenados alfabéticamente
+    def _sign(self, params):
+        query = urlencode(sorted(params.items()))
+        return hmac.new(self.api_secret.encode(), query.encode(), hashlib.sha256).hexdigest()
+
+    # Enviar un mensaje reconectando una vez si el socket se cerró (p. ej. por inactividad)
+    def _send(self, payload, reconnect=True):
+        if not reconnect and not self.connected:
+            raise WsApiConnectionError("WS-API desconectado")
+        
+        error = None
+        for _ in range(2 if reconnect else 1):
+            try:
+                if not self.connected:
+                    self.connect()
+                self._ws.send(payload)
+                return
+            except (websocket.WebSocketException, OSError) as e:
+                self.close()
+                error = e
+        raise WsApiConnectionError(str(error))
+
+    def request(self, method, params=None, signed=False, reconnect=True):
+        params = dict(params or {})
+        if signed:
+            params['apiKey'] = self.api_key
+            params['timestamp'] = int(time.time() * 1000)
+            params['recvWindow'] = RECV_WINDOW
+            params['signature'] = self._sign(params)
+        
+        request_id = uuid.uuid4().hex
+        message = {'id': request_id, 'method': method}
+        if params:
+            message['params'] = params
+        self._send(json.dumps(message), reconnect=reconnect)
+        
+        # Una vez enviada la petición, un fallo de lectura deja su resultado en estado desconocido
+        try:
+            while True:
+                response = json.loads(self._ws.recv())
+                if response.get('id') == request_id:
+                    break
+        except (websocket.WebSocketException, OSError, ValueError) as e:
+            self.close()
+            raise WsApiUnknownStateError(f"Sin respuesta del WS-API para {method}: {str(e)}")
+        
+        if response.get('status') != 200:
+            raise BinanceAPIException(None, response.get('status'), json.dumps(response.get('error')))
+        return response['result']
+
+    # Mantener viva la conexión y responder a los pings pendientes del servidor;
+    # no reconecta y usa un timeout corto para no frenar el bucle de trading
+    def ping(self):
+        self._ws.settimeout(WS_API_PING_TIMEOUT)
+        try:
+            return self.request('ping', reconnect=False)
+        finally:
+            if self._ws is not None:
+                self._ws.settimeout(WS_API_TIMEOUT)
+
+    def place_market_order(self, symbol, side, quantity, client_order_id):
+        return self.request('order.place', {
+            'symbol': symbol,
+            'side': side,
+            'type': ORDER_TYPE_MARKET,
+            'quantity': quantity,
+            'newClientOrderId': client_order_id
+        }, signed=True)
+
+# Posición abierta en el par
+@dataclass(slots=True)
+class Position:
+    in_position: bool = False
+    quantity: float = 0
+    buy_price: float = 0
+    # Inverso del valor de compra (quantity * buy_price): el P&L se calcula con multiplicaciones
+    inv_buy_value: float = 0
+
 # Clase principal del bot de trading
 class CryptoTradeBot:
+    __slots__ = (
+        'config', 'logger', 'client', 'symbol', 'timeframe', 'rsi_period', 'rsi_overbought',
+        'rsi_oversold', 'bollinger_period', 'bollinger_std', 'initial_balance', 'position',
+        'transactions', 'twm', '_binance_tf', '_filters', '_step_size', '_quantity_precision',
+        '_min_notional', '_last_saved_len', '_klines', '_klines_lock', '_klines_gap', '_last_kline_update',
+        '_last_price', '_last_price_update', '_interval_seconds', '_buf_gain', '_buf_loss',
+        '_buf_avg_gain', '_buf_avg_loss', '_avg_gain', '_avg_loss', '_window_closes',
+        '_window_sum', '_window_sumsq', '_prev_close', '_last_indicator_ts', '_rsi',
+        '_upper_band', '_lower_band', '_ws_api'
+    )
+
     def __init__(self, api_key, api_secret, config):
         self.config = config
         self.logger = logging.getLogger('crypto_trade_bot')
         
-        # Inicializar cliente de Binance
+        # Inicializar cliente de Binance (mantiene una requests.Session con conexiones reutilizables)
         try:
             self.client = Client(api_key, api_secret)
             self.logger.info("Cliente de Binance inicializado correctamente")
         except Exception as e:
-            self.logger.error(f"Error al inicializar el cliente de Binance: {str(e)}")
+            self.logger.error("Error al inicializar el cliente de Binance: %s", e)
             raise
         
         # Parámetros del bot
         self.symbol = config['trading_pair']
         self.timeframe = config['timeframe']
+        self._binance_tf = _TIMEFRAME_MAP.get(self.timeframe, Client.KLINE_INTERVAL_1HOUR)
         self.rsi_period = config['rsi_period']
         self.rsi_overbought = config['rsi_overbought']
         self.rsi_oversold = config['rsi_oversold']
         self.bollinger_period = config['bollinger_period']
         self.bollinger_std = config['bollinger_std']
         self.initial_balance = config['initial_balance']
-        self.position = {
-            'in_position': False,
-            'quantity': 0,
-            'buy_price': 0
-        }
+        
+        # Reglas de mercado del par, que no cambian durante la ejecución
+        try:
+            info = self.client.get_symbol_info(self.symbol)
+            self._filters = {f['filterType']: f for f in info['filters']}
+            self._step_size = float(self._filters['LOT_SIZE']['stepSize'])
+            self._quantity_precision = int(round(-math.log10(self._step_size)))
+            notional_filter = self._filters.get('MIN_NOTIONAL') or self._filters.get('NOTIONAL')
+            self._min_notional = float(notional_filter['minNotional']) if notional_filter else 0.0
+        except Exception as e:
+            self.logger.error("Error al obtener la información del par %s: %s", self.symbol, e)
+            raise
+        
+        self.position = Position()
         
         # Registro de transacciones
         self.transactions = []
+        self._last_saved_len = 0
+        
+        # Buffer en memoria de velas cerradas (ts, open, high, low, close, volume)
+        self._klines = deque(maxlen=self.bollinger_period * 3)
+        self._klines_lock = threading.Lock()
+        self._klines_gap = False
+        self._last_kline_update = 0.0
+        self._last_price = None
+        self._last_price_update = 0.0
+        self._interval_seconds = timeframe_to_seconds(self._binance_tf)
+        
+        # Buffers preasignados para el cálculo vectorizado sobre la ventana completa
+        window_size = self.bollinger_period * 3
+        self._buf_gain = np.empty(window_size)
+        self._buf_loss = np.empty(window_size)
+        self._buf_avg_gain = np.empty(window_size)
+        self._buf_avg_loss = np.empty(window_size)
+        
+        # Estado incremental de los indicadores (RSI de Wilder y sumas móviles de Bollinger)
+        self._avg_gain = 0.0
+        self._avg_loss = 0.0
+        self._window_closes = deque(maxlen=self.bollinger_period)
+        self._window_sum = 0.0
+        self._window_sumsq = 0.0
+        self._prev_close = None
+        self._last_indicator_ts = None
+        self._rsi = math.nan
+        self._upper_band = math.nan
+        self._lower_band = math.nan
+        
+        # Conexión persistente al WS-API para enviar órdenes sin pasar por REST
+        self._ws_api = BinanceWsApi(api_key, api_secret)
+        try:
+            self._ws_api.connect()
+            self.logger.info("Conexión al WS-API de Binance establecida")
+        except Exception as e:
+            self.logger.warning("No se pudo conectar al WS-API, se reintentará al enviar órdenes: %s", e)
+        
+        # Suscripción por websocket a velas y precio en tiempo real
+        try:
+            self.twm = ThreadedWebsocketManager(api_key=api_key, api_secret=api_secret)
+            self.twm.start()
+            self.twm.start_kline_socket(callback=self._on_kline, symbol=self.symbol, interval=self._binance_tf)
+            self.twm.start_symbol_ticker_socket(callback=self._on_ticker, symbol=self.symbol)
+            self.logger.info("Websockets de velas y ticker iniciados correctamente")
+        except Exception as e:
+            self.logger.error("Error al iniciar los websockets de Binance: %s", e)
+            raise
 
-    # Obtener datos históricos de Binance
+    # Callback del websocket de velas: solo se guardan las velas cerradas
+    def _on_kline(self, msg):
+        if msg.get('e') == 'error':
+            self.logger.warning("Error en websocket de velas: %s", msg.get('m'))
+            return
+        
+        k = msg['k']
+        self._last_kline_update = time.time()
+        if not k['x']:
+            return
+        
+        bar = (k['t'], float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v']))
+        with self._klines_lock:
+            self._append_bar(bar)
+
+    # Añadir una vela cerrada al buffer (llamar con _klines_lock adquirido)
+    def _append_bar(self, bar):
+        # Velas perdidas (p. ej. tras una reconexión): forzar la recarga completa por REST
+        if self._klines and bar[0] > self._klines[-1][0] + self._interval_seconds * 1000:
+            self._klines_gap = True
+        # Evitar duplicados entre las velas del websocket y las cargadas por REST
+        if not self._klines or bar[0] > self._klines[-1][0]:
+            self._klines.append(bar)
+
+    # Callback del websocket de ticker: último precio negociado
+    def _on_ticker(self, msg):
+        if msg.get('e') == 'error':
+            self.logger.warning("Error en websocket de ticker: %s", msg.get('m'))
+            return
+        
+        self._last_price = float(msg['c'])
+        self._last_price_update = time.time()
+
+    # Un dato se considera obsoleto si no se ha actualizado en más de max_age segundos
+    # (por defecto, un intervalo del timeframe)
+    def _is_stale(self, last_update, max_age=None):
+        if max_age is None:
+            max_age = self._interval_seconds
+        return time.time() - last_update > max_age
+
+    # El buffer necesita una carga completa por REST si no tiene la ventana entera o tiene huecos
+    def _needs_full_load(self):
+        return len(self._klines) < self._klines.maxlen or self._klines_gap
+
+    # Construir arrays float64 por columna a partir del buffer de velas
+    def _build_arrays(self):
+        with self._klines_lock:
+            bars = list(self._klines)
+        
+        # Transponer para que cada columna quede contigua en memoria; el timestamp se deja
+        # en milisegundos (float64 exacto) y solo se convierte el valor que se necesite
+        cols = np.ascontiguousarray(np.array(bars, dtype=np.float64).reshape(-1, 6).T)
+        return {
+            'timestamp': cols[0],
+            'open': cols[1],
+            'high': cols[2],
+            'low': cols[3],
+            'close': cols[4],
+            'volume': cols[5]
+        }
+
+    # Obtener datos históricos de Binance (carga inicial y respaldo si el websocket se retrasa)
     def get_historical_data(self):
         try:
-            # Convertir el timeframe a formato Binance
-            timeframe_map = {
-                '1m': Client.KLINE_INTERVAL_1MINUTE,
-                '5m': Client.KLINE_INTERVAL_5MINUTE,
-                '15m': Client.KLINE_INTERVAL_15MINUTE,
-                '1h': Client.KLINE_INTERVAL_1HOUR,
-                '4h': Client.KLINE_INTERVAL_4HOUR,
-                '1d': Client.KLINE_INTERVAL_1DAY
-            }
-            
-            binance_timeframe = timeframe_map.get(self.timeframe, Client.KLINE_INTERVAL_1HOUR)
-            
-            # Obtener datos históricos
-            klines = self.client.get_historical_klines(
-                self.symbol, 
-                binance_timeframe, 
-                f"{self.bollinger_period * 3} {self.timeframe} ago UTC"
-            )
+            now_ms = int(time.time() * 1000)
+            interval_ms = self._interval_seconds * 1000
+            with self._klines_lock:
+                last_ts = self._klines[-1][0] if self._klines else None
+                needs_full_load = self._needs_full_load()
             
-            # Convertir a DataFrame
-            data = pd.DataFrame(klines, columns=[
-                'timestamp', 'open', 'high', 'low', 'close', 'volume', 
-                'close_time', 'quote_asset_volume', 'number_of_trades',
-                'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-            ])
+            # Con el buffer completo, reciente y sin huecos solo se piden las velas posteriores a la última guardada
+            incremental = not needs_full_load and now_ms - last_ts <= self._klines.maxlen * interval_ms
+            if incremental:
+                # La siguiente vela aún no ha cerrado: no hay nada nuevo que descargar
+                if now_ms < last_ts + 2 * interval_ms:
+                    return self._build_arrays()
+                
+                klines = self.client.get_klines(
+                    symbol=self.symbol,
+                    interval=self._binance_tf,
+                    startTime=last_ts + 1,
+                    limit=(now_ms - last_ts) // interval_ms + 1
+                )
+            else:
+                # Pedir la ventana por número de velas; la última sigue abierta y se descarta
+                klines = self.client.get_klines(
+                    symbol=self.symbol,
+                    interval=self._binance_tf,
+                    limit=self._klines.maxlen + 1
+                )
             
-            # Convertir tipos de datos
-            data['timestamp'] = pd.to_datetime(data['timestamp'], unit='ms')
-            data['close'] = data['close'].astype(float)
+            # Descartar la vela en curso, que aún no ha cerrado
+            bars = [(k[0], float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]))
+                    for k in klines if k[6] < now_ms]
+            with self._klines_lock:
+                if not incremental:
+                    # Conservar las velas del websocket más recientes que la respuesta REST
+                    newer = [bar for bar in self._klines if not bars or bar[0] > bars[-1][0]]
+                    self._klines.clear()
+                    self._klines_gap = False
+                    bars.extend(newer)
+                for bar in bars:
+                    self._append_bar(bar)
+            self._last_kline_update = time.time()
             
-            self.logger.info(f"Datos históricos obtenidos correctamente. Filas: {len(data)}")
+            data = self._build_arrays()
+            self.logger.info("Datos históricos obtenidos correctamente. Velas nuevas: %s, filas: %s", len(klines), len(data['close']))
             return data
         
         except BinanceAPIException as e:
-            self.logger.error(f"Error de API Binance: {str(e)}")
+            self.logger.error("Error de API Binance: %s", e)
             return None
         except BinanceRequestException as e:
-            self.logger.error(f"Error de solicitud a Binance: {str(e)}")
+            self.logger.error("Error de solicitud a Binance: %s", e)
             return None
         except Exception as e:
-            self.logger.error(f"Error desconocido al obtener datos históricos: {str(e)}")
+            self.logger.error("Error desconocido al obtener datos históricos: %s", e)
             return None
 
-    # Calcular RSI
-    def calculate_rsi(self, data, period=14):
-        delta = data['close'].diff()
-        gain = delta.mask(delta < 0, 0)
-        loss = -delta.mask(delta > 0, 0)
+    # Medias suavizadas de Wilder de ganancias y pérdidas; si el tamaño coincide con la ventana
+    # se reutilizan los buffers preasignados (el resultado se sobrescribe en la siguiente llamada)
+    def _wilder_averages(self, close, period):
+        bufs = None
+        if close.shape[0] == self._buf_gain.shape[0]:
+            bufs = (self._buf_gain, self._buf_loss, self._buf_avg_gain, self._buf_avg_loss)
+        return _wilder_averages(close, period, bufs)
+
+    # Calcular RSI (serie completa, suavizado de Wilder); out permite reutilizar el array de salida
+    def calculate_rsi(self, data, period=14, out=None):
+        close = np.ascontiguousarray(data['close'], dtype=np.float64)
+        avg_gain, avg_loss = self._wilder_averages(close, period)
+        rsi = np.empty_like(close) if out is None else out
+        return _rsi_from_averages(avg_gain, avg_loss, rsi)
+
+    # Calcular Bandas de Bollinger; out=(sma, upper, lower) permite reutilizar los arrays de salida
+    def calculate_bollinger_bands(self, data, period=20, std_dev=2, out=None):
+        close = np.ascontiguousarray(data['close'], dtype=np.float64)
+        if out is None:
+            sma, upper, lower = np.empty_like(close), np.empty_like(close), np.empty_like(close)
+        else:
+            sma, upper, lower = out
+        _bollinger_bands(close, period, std_dev, sma, upper, lower)
         
-        avg_gain = gain.rolling(window=period).mean()
-        avg_loss = loss.rolling(window=period).mean()
+        data['sma'] = sma
+        data['upper_band'] = upper
+        data['lower_band'] = lower
+        return data
+
+    # Inicializar el estado incremental de los indicadores a partir de la ventana completa
+    def _warmup_indicators(self, data):
+        close = np.ascontiguousarray(data['close'], dtype=np.float64)
+        avg_gain, avg_loss = self._wilder_averages(close, self.rsi_period)
+        self._avg_gain = float(avg_gain[-1])
+        self._avg_loss = float(avg_loss[-1])
         
-        rs = avg_gain / avg_loss
-        rsi = 100 - (100 / (1 + rs))
+        window = close[-self.bollinger_period:]
+        self._window_closes = deque(window.tolist(), maxlen=self.bollinger_period)
+        self._window_sum = float(window.sum())
+        self._window_sumsq = float((window * window).sum())
         
-        return rsi
+        self._prev_close = float(close[-1])
+        self._last_indicator_ts = int(data['timestamp'][-1])
 
-    # Calcular Bandas de Bollinger
-    def calculate_bollinger_bands(self, data, period=20, std_dev=2):
-        data['sma'] = data['close'].rolling(window=period).mean()
-        data['std'] = data['close'].rolling(window=period).std()
-        data['upper_band'] = data['sma'] + (data['std'] * std_dev)
-        data['lower_band'] = data['sma'] - (data['std'] * std_dev)
+    # Actualizar los indicadores en O(1) con una nueva vela cerrada
+    def _update_indicators(self, close):
+        p = self.rsi_period
+        delta = close - self._prev_close
+        gain, loss = max(delta, 0.0), max(-delta, 0.0)
+        self._avg_gain = (self._avg_gain * (p - 1) + gain) / p
+        self._avg_loss = (self._avg_loss * (p - 1) + loss) / p
         
-        return data
+        old = self._window_closes[0]
+        self._window_closes.append(close)
+        self._window_sum += close - old
+        self._window_sumsq += close * close - old * old
+        
+        self._prev_close = close
+
+    # Sincronizar los indicadores con las velas cerradas aún no procesadas
+    def _sync_indicators(self, data):
+        timestamps = data['timestamp']
+        new_bars = 0
+        if self._last_indicator_ts is not None:
+            while new_bars < len(timestamps) and timestamps[-1 - new_bars] > self._last_indicator_ts:
+                new_bars += 1
+        
+        # Las velas nuevas deben seguir a la última procesada sin huecos entre ellas
+        contiguous = (
+            new_bars < len(timestamps)
+            and timestamps[-1 - new_bars] == self._last_indicator_ts
+            and np.all(np.diff(timestamps[-1 - new_bars:]) == self._interval_seconds * 1000)
+        )
+        
+        # Sin estado previo o con huecos: recalcular sobre la ventana completa
+        if self._last_indicator_ts is None or not contiguous:
+            self._warmup_indicators(data)
+        else:
+            for close in data['close'][len(timestamps) - new_bars:]:
+                self._update_indicators(float(close))
+            self._last_indicator_ts = int(timestamps[-1])
+        
+        # RSI (NaN si la ventana es plana, igual que en calculate_rsi)
+        if self._avg_loss == 0:
+            self._rsi = 100.0 if self._avg_gain > 0 else math.nan
+        else:
+            self._rsi = 100 - (100 / (1 + self._avg_gain / self._avg_loss))
+        
+        # Bandas de Bollinger (desviación estándar muestral, como rolling().std())
+        p = self.bollinger_period
+        sma = self._window_sum / p
+        std = math.sqrt(max((self._window_sumsq - self._window_sum * sma) / (p - 1), 0.0))
+        self._upper_band = sma + std * self.bollinger_std
+        self._lower_band = sma - std * self.bollinger_std
+
+    # Enviar orden de mercado por el WS-API; si el socket no está disponible, por REST
+    def _create_market_order(self, side, quantity):
+        # Identificador propio para poder consultar la orden si se pierde la respuesta
+        client_order_id = f"ctb-{uuid.uuid4().hex}"
+        try:
+            return self._ws_api.place_market_order(
+                self.symbol, side, f"{quantity:.{max(self._quantity_precision, 0)}f}", client_order_id
+            )
+        except WsApiConnectionError as e:
+            self.logger.warning("WS-API no disponible, enviando la orden por REST: %s", e)
+            return self.client.create_order(
+                symbol=self.symbol,
+                side=side,
+                type=ORDER_TYPE_MARKET,
+                quantity=quantity,
+                newClientOrderId=client_order_id,
+                recvWindow=RECV_WINDOW
+            )
+        except WsApiUnknownStateError as e:
+            self.logger.warning("Orden %s enviada sin respuesta del WS-API, consultando su estado: %s", client_order_id, e)
+            return self._reconcile_order(client_order_id)
+
+    # Consultar por REST una orden cuyo resultado se desconoce
+    def _reconcile_order(self, client_order_id):
+        # La orden puede tardar en aparecer; pasado recvWindow Binance ya no la aceptaría
+        error = None
+        for attempt in range(3):
+            # Esperar solo entre intentos, no tras el último
+            if attempt:
+                time.sleep(2)
+            try:
+                return self.client.get_order(symbol=self.symbol, origClientOrderId=client_order_id, recvWindow=RECV_WINDOW)
+            except BinanceAPIException as e:
+                # -2013: la orden no existe (todavía)
+                if e.code != -2013:
+                    raise
+                error = e
+            except Exception as e:
+                error = e
+        
+        self.logger.error("No se pudo confirmar el estado de la orden %s", client_order_id)
+        raise error
 
     # Ejecutar orden de compra
     def execute_buy_order(self, price):
         try:
-            balance = float(self.client.get_asset_balance(asset='USDT')['free'])
+            balance = float(self.client.get_asset_balance(asset='USDT', recvWindow=RECV_WINDOW)['free'])
             
             if balance < self.config['min_order_value']:
-                self.logger.warning(f"Balance insuficiente para comprar: {balance} USDT")
+                self.logger.warning("Balance insuficiente para comprar: %s USDT", balance)
                 return False
             
             # Calcular cantidad a comprar
@@ -160,28 +716,24 @@ class CryptoTradeBot:
             quantity = order_value / price
             
             # Redondear la cantidad según las reglas del mercado
-            info = self.client.get_symbol_info(self.symbol)
-            lot_size_filter = next(filter(lambda f: f['filterType'] == 'LOT_SIZE', info['filters']))
-            step_size = float(lot_size_filter['stepSize'])
-            precision = int(round(-math.log10(step_size)))
-            quantity = round(quantity, precision)
+            quantity = round(quantity, self._quantity_precision)
             
-            if quantity * price < self.config['min_order_value']:
-                self.logger.warning(f"Orden demasiado pequeña: {quantity} {self.symbol} @ {price}")
+            if quantity * price < max(self.config['min_order_value'], self._min_notional):
+                self.logger.warning("Orden demasiado pequeña: %s %s @ %s", quantity, self.symbol, price)
                 return False
             
-            # Ejecutar la orden
-            order = self.client.create_order(
-                symbol=self.symbol,
-                side=SIDE_BUY,
-                type=ORDER_TYPE_MARKET,
-                quantity=quantity
-            )
+            # Ejecutar la orden y usar la cantidad realmente ejecutada
+            order = self._create_market_order(SIDE_BUY, quantity)
+            quantity = float(order['executedQty'])
+            if quantity <= 0:
+                self.logger.warning("Orden de compra no ejecutada: estado %s", order.get('status'))
+                return False
             
             # Actualizar posición
-            self.position['in_position'] = True
-            self.position['quantity'] = quantity
-            self.position['buy_price'] = price
+            self.position.in_position = True
+            self.position.quantity = quantity
+            self.position.buy_price = price
+            self.position.inv_buy_value = 1.0 / (quantity * price)
             
             # Registrar transacción
             transaction = {
@@ -194,37 +746,34 @@ class CryptoTradeBot:
             }
             self.transactions.append(transaction)
             
-            self.logger.info(f"Orden de compra ejecutada: {quantity} {self.symbol} @ {price}")
+            self.logger.info("Orden de compra ejecutada: %s %s @ %s", quantity, self.symbol, price)
             return True
             
         except BinanceAPIException as e:
-            self.logger.error(f"Error de API Binance al comprar: {str(e)}")
+            self.logger.error("Error de API Binance al comprar: %s", e)
             return False
         except Exception as e:
-            self.logger.error(f"Error desconocido al comprar: {str(e)}")
-            traceback.print_exc()
+            self.logger.exception("Error desconocido al comprar: %s", e)
             return False
 
     # Ejecutar orden de venta
     def execute_sell_order(self, price):
         try:
-            if not self.position['in_position']:
+            if not self.position.in_position:
                 self.logger.warning("Intento de venta sin posición abierta")
                 return False
             
             # Ejecutar la orden
-            order = self.client.create_order(
-                symbol=self.symbol,
-                side=SIDE_SELL,
-                type=ORDER_TYPE_MARKET,
-                quantity=self.position['quantity']
-            )
+            order = self._create_market_order(SIDE_SELL, self.position.quantity)
+            if float(order['executedQty']) <= 0:
+                self.logger.warning("Orden de venta no ejecutada: estado %s", order.get('status'))
+                return False
             
             # Calcular ganancia/pérdida
-            buy_value = self.position['quantity'] * self.position['buy_price']
-            sell_value = self.position['quantity'] * price
+            buy_value = self.position.quantity * self.position.buy_price
+            sell_value = self.position.quantity * price
             profit = sell_value - buy_value
-            profit_percent = (profit / buy_value) * 100
+            profit_percent = profit * self.position.inv_buy_value * 100
             
             # Registrar transacción
             transaction = {
@@ -232,7 +781,7 @@ class CryptoTradeBot:
                 'timestamp': datetime.datetime.now().isoformat(),
                 'symbol': self.symbol,
                 'price': price,
-                'quantity': self.position['quantity'],
+                'quantity': self.position.quantity,
                 'value': sell_value,
                 'profit': profit,
                 'profit_percent': profit_percent
@@ -240,73 +789,92 @@ class CryptoTradeBot:
             self.transactions.append(transaction)
             
             # Actualizar posición
-            self.position['in_position'] = False
-            self.position['quantity'] = 0
-            self.position['buy_price'] = 0
+            self.position.in_position = False
+            self.position.quantity = 0
+            self.position.buy_price = 0
+            self.position.inv_buy_value = 0
             
-            self.logger.info(f"Orden de venta ejecutada: {transaction['quantity']} {self.symbol} @ {price}. Profit: {profit_percent:.2f}%")
+            self.logger.info("Orden de venta ejecutada: %s %s @ %s. Profit: %.2f%%", transaction['quantity'], self.symbol, price, profit_percent)
             return True
             
         except BinanceAPIException as e:
-            self.logger.error(f"Error de API Binance al vender: {str(e)}")
+            self.logger.error("Error de API Binance al vender: %s", e)
             return False
         except Exception as e:
-            self.logger.error(f"Error desconocido al vender: {str(e)}")
-            traceback.print_exc()
+            self.logger.exception("Error desconocido al vender: %s", e)
             return False
 
-    # Actualizar registro de transacciones
+    # Añadir las transacciones nuevas al registro (una línea JSON por transacción)
     def save_transactions(self):
+        if len(self.transactions) == self._last_saved_len:
+            return
+        
         try:
-            with open('transactions.json', 'w') as f:
-                json.dump(self.transactions, f, indent=4)
+            with open('transactions.jsonl', 'ab') as f:
+                for transaction in self.transactions[self._last_saved_len:]:
+                    f.write(orjson.dumps(transaction, option=orjson.OPT_APPEND_NEWLINE))
+            self._last_saved_len = len(self.transactions)
             self.logger.info("Registro de transacciones guardado")
         except Exception as e:
-            self.logger.error(f"Error al guardar transacciones: {str(e)}")
+            self.logger.error("Error al guardar transacciones: %s", e)
+
+    # Guardar una copia consolidada de las transacciones de la sesión
+    def save_transactions_snapshot(self):
+        try:
+            with open('transactions.json', 'wb') as f:
+                f.write(orjson.dumps(self.transactions, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+            self.logger.info("Copia consolidada de transacciones guardada")
+        except Exception as e:
+            self.logger.error("Error al guardar la copia de transacciones: %s", e)
 
     # Análisis técnico y decisión de trading
     def analyze_and_trade(self):
-        # Obtener datos históricos
-        data = self.get_historical_data()
-        if data is None or len(data) < self.bollinger_period:
+        # Leer velas del buffer; recurrir a REST solo si está incompleto, con huecos u obsoleto
+        if self._needs_full_load() or self._is_stale(self._last_kline_update):
+            data = self.get_historical_data()
+        else:
+            data = self._build_arrays()
+        if data is None or len(data['close']) < self.bollinger_period:
             self.logger.warning("Datos insuficientes para análisis")
             return
         
-        # Calcular indicadores
-        data['rsi'] = self.calculate_rsi(data, self.rsi_period)
-        data = self.calculate_bollinger_bands(data, self.bollinger_period, self.bollinger_std)
+        # Actualizar indicadores solo con las velas nuevas
+        self._sync_indicators(data)
+        rsi = self._rsi
+        upper_band = self._upper_band
+        lower_band = self._lower_band
         
-        # Obtener última fila de datos
-        latest = data.iloc[-1]
-        
-        # Obtener precio actual
-        try:
-            ticker = self.client.get_symbol_ticker(symbol=self.symbol)
-            current_price = float(ticker['price'])
-        except Exception as e:
-            self.logger.error(f"Error al obtener precio actual: {str(e)}")
-            return
+        # Obtener precio actual del websocket; recurrir a REST si está obsoleto
+        current_price = self._last_price
+        if current_price is None or self._is_stale(self._last_price_update, PRICE_STALE_SECONDS):
+            try:
+                ticker = self.client.get_symbol_ticker(symbol=self.symbol)
+                current_price = float(ticker['price'])
+            except Exception as e:
+                self.logger.error("Error al obtener precio actual: %s", e)
+                return
         
         # Lógica de trading
-        self.logger.info(f"Análisis para {self.symbol}: Precio={current_price}, RSI={latest['rsi']:.2f}, "
-                         f"BB Superior={latest['upper_band']:.2f}, BB Inferior={latest['lower_band']:.2f}")
+        self.logger.info("Análisis para %s: Precio=%s, RSI=%.2f, BB Superior=%.2f, BB Inferior=%.2f",
+                         self.symbol, current_price, rsi, upper_band, lower_band)
+        buy, sell = _signals(current_price, rsi, upper_band, lower_band, self.rsi_oversold, self.rsi_overbought)
         
-        # Señal de compra: RSI por debajo del nivel de sobreventa y precio cerca o por debajo de la banda inferior
-        if not self.position['in_position'] and latest['rsi'] < self.rsi_oversold and current_price <= latest['lower_band'] * 1.02:
-            self.logger.info(f"Señal de COMPRA detectada: RSI={latest['rsi']:.2f}, Precio={current_price}")
+        # Señal de compra
+        if not self.position.in_position and buy:
+            self.logger.info("Señal de COMPRA detectada: RSI=%.2f, Precio=%s", rsi, current_price)
             self.execute_buy_order(current_price)
         
-        # Señal de venta: RSI por encima del nivel de sobrecompra o precio cerca o por encima de la banda superior
-        elif self.position['in_position'] and (latest['rsi'] > self.rsi_overbought or current_price >= latest['upper_band'] * 0.98):
-            profit_percent = ((current_price - self.position['buy_price']) / self.position['buy_price']) * 100
-            self.logger.info(f"Señal de VENTA detectada: RSI={latest['rsi']:.2f}, Precio={current_price}, Ganancia potencial={profit_percent:.2f}%")
+        # Señal de venta
+        elif self.position.in_position and sell:
+            profit_percent = (current_price * self.position.quantity * self.position.inv_buy_value - 1) * 100
+            self.logger.info("Señal de VENTA detectada: RSI=%.2f, Precio=%s, Ganancia potencial=%.2f%%", rsi, current_price, profit_percent)
             self.execute_sell_order(current_price)
         
         # También vender si hay una pérdida significativa para gestionar el riesgo
-        elif self.position['in_position']:
-            loss_percent = ((current_price - self.position['buy_price']) / self.position['buy_price']) * 100
+        elif self.position.in_position:
+            loss_percent = (current_price * self.position.quantity * self.position.inv_buy_value - 1) * 100
             if loss_percent < -self.config['max_loss_percent']:
-                self.logger.warning(f"Stop loss activado: Pérdida={loss_percent:.2f}%")
+                self.logger.warning("Stop loss activado: Pérdida=%.2f%%", loss_percent)
                 self.execute_sell_order(current_price)
         
         # Guardar transacciones después de cada análisis
@@ -314,25 +882,46 @@ class CryptoTradeBot:
 
     # Bucle principal del bot
     def run(self):
-        self.logger.info(f"Iniciando bot de trading para {self.symbol}")
+        self.logger.info("Iniciando bot de trading para %s", self.symbol)
         
         try:
             while True:
                 self.analyze_and_trade()
                 
+                # Mantener viva la conexión del WS-API entre órdenes; si está caída se
+                # reconecta al enviar la próxima orden
+                if self._ws_api.connected:
+                    try:
+                        self._ws_api.ping()
+                    except Exception as e:
+                        self.logger.warning("Ping al WS-API fallido, se reconectará en la próxima orden: %s", e)
+                
                 # Esperar según el intervalo configurado
                 sleep_time = self.config.get('check_interval', 60)  # Por defecto, 60 segundos
-                self.logger.info(f"Esperando {sleep_time} segundos hasta el próximo análisis...")
+                self.logger.info("Esperando %s segundos hasta el próximo análisis...", sleep_time)
                 time.sleep(sleep_time)
                 
         except KeyboardInterrupt:
             self.logger.info("Bot detenido manualmente")
         except Exception as e:
-            self.logger.error(f"Error inesperado: {str(e)}")
-            traceback.print_exc()
+            self.logger.exception("Error inesperado: %s", e)
         finally:
             self.logger.info("Bot finalizado")
+            
+            # Guardar las transacciones antes de cerrar las conexiones
             self.save_transactions()
+            self.save_transactions_snapshot()
+            
+            # Cerrar cada conexión por separado para que un fallo no impida cerrar las demás
+            for name, close in (
+                ("websockets de velas y ticker", self.twm.stop),
+                ("WS-API", self._ws_api.close),
+                ("cliente REST", self.client.close_connection)
+            ):
+                try:
+                    close()
+                except Exception as e:
+                    self.logger.error("Error al cerrar %s: %s", name, e)
 
 # Punto de entrada principal
 if __name__ == "__main__":
@@ -355,5 +944,6 @@ if __name__ == "__main__":
         bot.run()
         
     except Exception as e:
-        logger.error(f"Error fatal: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error fatal: %s", e)
+    finally:
+        shutdown_logger(logger)
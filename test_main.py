@@ -0,0 +1,194 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import main
+
+INTERVAL_MS = 15 * 60 * 1000
+# Inicio de una vela de 15m, con la vela en curso abierta desde hace 5 minutos
+NOW_MS = 1_700_000_100_000 // INTERVAL_MS * INTERVAL_MS + 5 * 60 * 1000
+
+CONFIG = {
+    'trading_pair': 'BTCUSDT',
+    'timeframe': '15m',
+    'check_interval': 60,
+    'initial_balance': 100,
+    'min_order_value': 10,
+    'max_order_value': 50,
+    'max_loss_percent': 2.5,
+    'rsi_period': 14,
+    'rsi_oversold': 30,
+    'rsi_overbought': 70,
+    'bollinger_period': 20,
+    'bollinger_std': 2.0
+}
+
+
+# Exchange simulado: una vela por intervalo hasta la vela en curso según el reloj del test
+class FakeExchange:
+    def __init__(self, clock):
+        self.clock = clock
+
+    def kline(self, open_time):
+        close = 60000 + (open_time // INTERVAL_MS) % 7 * 10
+        return [open_time, str(close), str(close + 5), str(close - 5), str(close), '1.0',
+                open_time + INTERVAL_MS - 1]
+
+    def get_klines(self, symbol, interval, limit, startTime=None):
+        last_open = self.clock.now_ms // INTERVAL_MS * INTERVAL_MS
+        if startTime is None:
+            first_open = last_open - (limit - 1) * INTERVAL_MS
+        else:
+            first_open = -(-startTime // INTERVAL_MS) * INTERVAL_MS
+        opens = range(first_open, last_open + 1, INTERVAL_MS)
+        return [self.kline(t) for t in opens][:limit]
+
+
+class Clock:
+    def __init__(self, now_ms):
+        self.now_ms = now_ms
+
+    def time(self):
+        return self.now_ms / 1000
+
+
+class KlineBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock(NOW_MS)
+        self.exchange = FakeExchange(self.clock)
+
+        patches = [
+            mock.patch.object(main.time, 'time', self.clock.time),
+            mock.patch.object(main, 'Client'),
+            mock.patch.object(main, 'ThreadedWebsocketManager'),
+            mock.patch.object(main, 'BinanceWsApi')
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+        main.Client.return_value.get_symbol_info.return_value = {
+            'filters': [{'filterType': 'LOT_SIZE', 'stepSize': '0.00001'}]
+        }
+        self.bot = main.CryptoTradeBot('key', 'secret', CONFIG)
+        self.client = self.bot.client
+        self.client.get_klines.side_effect = self.exchange.get_klines
+
+    def push_closed_kline(self, open_time):
+        k = self.exchange.kline(open_time)
+        self.bot._on_kline({'e': 'kline', 'k': {
+            't': k[0], 'o': k[1], 'h': k[2], 'l': k[3], 'c': k[4], 'v': k[5], 'x': True
+        }})
+
+    def push_price(self):
+        self.bot._on_ticker({'e': '24hrTicker', 'c': '60000.0'})
+
+    def test_full_load_fills_buffer_with_closed_bars(self):
+        self.push_price()
+        self.bot.analyze_and_trade()
+
+        self.client.get_klines.assert_called_once_with(symbol='BTCUSDT', interval='15m', limit=61)
+        self.assertEqual(len(self.bot._klines), self.bot._klines.maxlen)
+        current_open = NOW_MS // INTERVAL_MS * INTERVAL_MS
+        self.assertEqual(self.bot._klines[-1][0], current_open - INTERVAL_MS)
+        self.assertFalse(self.bot._needs_full_load())
+
+    def test_full_load_keeps_newer_websocket_bars(self):
+        # El websocket ya entregó la vela que la respuesta REST todavía no incluye como cerrada
+        current_open = NOW_MS // INTERVAL_MS * INTERVAL_MS
+        self.push_closed_kline(current_open)
+        self.bot.get_historical_data()
+
+        self.assertEqual(len(self.bot._klines), self.bot._klines.maxlen)
+        self.assertEqual(self.bot._klines[-1][0], current_open)
+        self.assertFalse(self.bot._klines_gap)
+
+    def test_full_load_then_incremental_fetch(self):
+        self.push_price()
+        self.bot.analyze_and_trade()
+        last_ts = self.bot._klines[-1][0]
+
+        # Sin datos del websocket durante varias velas: solo se piden las que faltan
+        self.clock.now_ms += 3 * INTERVAL_MS
+        self.push_price()
+        self.client.get_klines.reset_mock()
+        self.bot.analyze_and_trade()
+
+        self.client.get_klines.assert_called_once()
+        self.assertEqual(self.client.get_klines.call_args.kwargs['startTime'], last_ts + 1)
+        self.assertEqual(len(self.bot._klines), self.bot._klines.maxlen)
+        self.assertEqual(self.bot._klines[-1][0], last_ts + 3 * INTERVAL_MS)
+        self.assertFalse(self.bot._needs_full_load())
+
+    def test_normal_cycle_reads_websocket_without_rest(self):
+        self.push_price()
+        self.bot.analyze_and_trade()
+        last_ts = self.bot._klines[-1][0]
+
+        # Cierra la siguiente vela y llega un precio nuevo por el websocket
+        self.clock.now_ms += INTERVAL_MS
+        self.push_closed_kline(last_ts + INTERVAL_MS)
+        self.push_price()
+        self.client.reset_mock()
+        self.bot.analyze_and_trade()
+
+        self.assertEqual(self.client.method_calls, [])
+        self.assertEqual(self.bot._klines[-1][0], last_ts + INTERVAL_MS)
+        self.assertEqual(self.bot._last_indicator_ts, last_ts + INTERVAL_MS)
+
+    def test_flat_window_has_undefined_incremental_rsi(self):
+        timestamps = np.arange(61, dtype=np.float64) * INTERVAL_MS
+        close = np.full(61, 60000.0)
+        self.bot._sync_indicators({'timestamp': timestamps[:-1], 'close': close[:-1]})
+        self.assertTrue(np.isnan(self.bot._rsi))
+
+        # Actualización incremental con una vela más, también sin variación
+        self.bot._sync_indicators({'timestamp': timestamps[1:], 'close': close[1:]})
+        self.assertTrue(np.isnan(self.bot._rsi))
+
+    def test_reconcile_sleeps_only_between_attempts(self):
+        self.client.get_order.side_effect = ConnectionError('sin respuesta')
+        with mock.patch.object(main.time, 'sleep') as sleep:
+            with self.assertRaises(ConnectionError):
+                self.bot._reconcile_order('cid')
+
+        self.assertEqual(self.client.get_order.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+
+class BacktestTest(unittest.TestCase):
+    def test_backtest_runs_without_bot_and_keeps_input(self):
+        close = 100 + 10 * np.sin(np.arange(300) / 8)
+        data = {'close': close}
+        original = close.copy()
+
+        trades = main.backtest(data['close'], 14, 20, 2.0, 30, 70)
+
+        self.assertEqual(list(data), ['close'])
+        np.testing.assert_array_equal(data['close'], original)
+        self.assertTrue(trades)
+        for trade in trades:
+            self.assertLess(trade['entry_index'], trade['exit_index'])
+
+
+class RsiTest(unittest.TestCase):
+    def test_flat_window_has_undefined_rsi(self):
+        close = np.full(40, 100.0)
+        avg_gain, avg_loss = main._wilder_averages(close, 14)
+        rsi = main._rsi_from_averages(avg_gain, avg_loss, np.empty_like(close))
+
+        self.assertTrue(np.isnan(rsi).all())
+        buy, sell = main._signals(close[-1], rsi[-1], np.inf, 0.0, 30, 70)
+        self.assertFalse(buy or sell)
+
+    def test_rising_window_has_rsi_100(self):
+        close = np.arange(40, dtype=np.float64)
+        avg_gain, avg_loss = main._wilder_averages(close, 14)
+        rsi = main._rsi_from_averages(avg_gain, avg_loss, np.empty_like(close))
+
+        self.assertEqual(rsi[-1], 100.0)
+
+
+if __name__ == '__main__':
+    unittest.main()